@@ -0,0 +1,233 @@
+"""Benchmark local de la API: siembra datos, reproduce peticiones y reporta latencias por ruta.
+
+Ejemplos:
+    python bench.py --movies 5000 --reviews-per-movie 50
+    python bench.py --log peticiones.ndjson --mode uvicorn --concurrency 64
+    python bench.py --output actual.json --baseline base.json --max-regression 0.2
+
+El log de peticiones es NDJSON con una petición por línea:
+    {"method": "GET", "path": "/movies/1"}
+    {"method": "POST", "path": "/movies/Cars/reviews/", "body": {"content": "...", "rating": 8}}
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+from starlette.routing import Match
+
+GENRES = ["Acción", "Comedia", "Drama", "Infantil", "Terror", "Ciencia ficción", "Romance"]
+WORDS = ["amor", "guerra", "viaje", "familia", "héroe", "noche", "ciudad", "secreto", "futuro", "león"]
+
+def seed_database(main, movies: int, reviews_per_movie: int, rng: random.Random):
+    def movie_lines():
+        for index in range(movies):
+            yield json.dumps({
+                "title": f"Película {index}",
+                "description": " ".join(rng.choices(WORDS, k=12)),
+                "year": rng.randint(1950, 2024),
+                "genre": rng.choice(GENRES),
+                "rating": rng.randint(1, 10),
+                "image_url": "images/Cars.jpg",
+            })
+
+    def review_lines():
+        for index in range(movies):
+            for _ in range(reviews_per_movie):
+                yield json.dumps({
+                    "title": f"Película {index}",
+                    "content": " ".join(rng.choices(WORDS, k=20)),
+                    "rating": rng.randint(1, 10),
+                })
+
+    with main.SessionLocal() as db:
+        for kind, source in (("movies", movie_lines()), ("reviews", review_lines())):
+            reader = main.BulkReader("ndjson")
+            for line in source:
+                batch = reader.feed(line)
+                if batch:
+                    main.IMPORTERS[kind](db, batch)
+                    db.commit()
+            main.IMPORTERS[kind](db, reader.finish())
+            db.commit()
+
+def default_workload(movies: int, reviews: int, rng: random.Random, size: int = 2000):
+    templates = [
+        lambda: ("GET", "/movies/?limit=50"),
+        lambda: ("GET", f"/movies/{rng.randint(1, movies)}"),
+        lambda: ("GET", f"/movies/title/Película {rng.randrange(movies)}"),
+        lambda: ("GET", f"/movies/genre/{rng.choice(GENRES)}"),
+        lambda: ("GET", f"/movies/Película {rng.randrange(movies)}/reviews/"),
+        lambda: ("GET", f"/movies/{rng.randint(1, movies)}/stats"),
+        lambda: ("GET", "/movies/top?min_reviews=1&limit=20"),
+        lambda: ("GET", f"/reviews/{rng.randint(1, max(reviews, 1))}"),
+        lambda: ("GET", f"/search?q={rng.choice(WORDS)[:4]}"),
+    ]
+    return [dict(zip(("method", "path"), rng.choice(templates)())) for _ in range(size)]
+
+def load_workload(path: str):
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def route_template(app, method: str, path: str) -> str:
+    scope = {"type": "http", "method": method, "path": path.split("?")[0]}
+    for route in app.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+async def replay(client: httpx.AsyncClient, app, workload, total: int, concurrency: int):
+    samples = defaultdict(list)  # ruta -> [(segundos, status, consultas)]
+    requests = itertools.islice(itertools.cycle(workload), total)
+
+    async def worker():
+        for request in requests:
+            method = request.get("method", "GET").upper()
+            started = time.perf_counter()
+            response = await client.request(method, request["path"], json=request.get("body"))
+            elapsed = time.perf_counter() - started
+            queries = int(response.headers.get("x-query-count", 0))
+            samples[(method, route_template(app, method, request["path"]))].append(
+                (elapsed, response.status_code, queries)
+            )
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - started
+
+def summarize(samples, elapsed: float):
+    routes = {}
+    for (method, route), values in sorted(samples.items()):
+        latencies = [value[0] for value in values]
+        routes[f"{method} {route}"] = {
+            "requests": len(values),
+            "errors": sum(1 for value in values if value[1] >= 500),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "queries_per_request": sum(value[2] for value in values) / len(values),
+        }
+    total = sum(len(values) for values in samples.values())
+    return {"requests": total, "seconds": elapsed, "throughput_rps": total / elapsed, "routes": routes}
+
+def print_report(report):
+    print(f"{report['requests']} peticiones en {report['seconds']:.2f}s ({report['throughput_rps']:.1f} req/s)")
+    print(f"{'ruta':<45} {'n':>7} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'sql/req':>8}")
+    for route, stats in report["routes"].items():
+        print(
+            f"{route:<45} {stats['requests']:>7} {stats['errors']:>5} {stats['p50_ms']:>9.2f} "
+            f"{stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f} {stats['queries_per_request']:>8.1f}"
+        )
+
+def find_regressions(report, baseline, max_regression: float):
+    regressions = []
+    for route, stats in report["routes"].items():
+        previous = baseline["routes"].get(route)
+        if previous and stats["p95_ms"] > previous["p95_ms"] * (1 + max_regression):
+            regressions.append(f"{route}: p95 {previous['p95_ms']:.2f}ms -> {stats['p95_ms']:.2f}ms")
+        # Media consulta más por petición ya indica un patrón N+1 nuevo
+        if previous and stats["queries_per_request"] > previous["queries_per_request"] + 0.5:
+            regressions.append(
+                f"{route}: sql/req {previous['queries_per_request']:.1f} -> {stats['queries_per_request']:.1f}"
+            )
+    return regressions
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_until_ready(client: httpx.AsyncClient, attempts: int = 100):
+    for _ in range(attempts):
+        try:
+            await client.get("/metrics")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("uvicorn did not start")
+
+async def run(args):
+    rng = random.Random(args.seed)
+    database = args.database or os.path.join(tempfile.mkdtemp(prefix="reviewapi-bench-"), "bench.db")
+    seed = not os.path.exists(database)
+    os.environ["DATABASE_URL"] = f"sqlite:///{database}"
+    import main
+
+    if seed:
+        print(f"Sembrando {args.movies} películas y {args.movies * args.reviews_per_movie} reseñas en {database}")
+        seed_database(main, args.movies, args.reviews_per_movie, rng)
+
+    workload = load_workload(args.log) if args.log else default_workload(
+        args.movies, args.movies * args.reviews_per_movie, rng
+    )
+
+    server = None
+    if args.mode == "uvicorn":
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+            env=dict(os.environ),
+        )
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=30)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench", timeout=30)
+
+    try:
+        async with client:
+            if server is not None:
+                await wait_until_ready(client)
+            if args.warmup:
+                await replay(client, main.app, workload, args.warmup, args.concurrency)
+            samples, elapsed = await replay(client, main.app, workload, args.requests, args.concurrency)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return summarize(samples, elapsed)
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark local de ReviewAPI.")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--log", help="NDJSON con las peticiones a reproducir (por defecto, una mezcla de lecturas)")
+    parser.add_argument("--database", help="SQLite a usar; si no existe se siembra")
+    parser.add_argument("--movies", type=int, default=1000)
+    parser.add_argument("--reviews-per-movie", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="guarda el reporte en JSON")
+    parser.add_argument("--baseline", help="reporte JSON previo con el que comparar")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="aumento tolerado del p95 (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = find_regressions(report, json.load(file), args.max_regression)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,90 @@
+"""Carga y exportación masiva de películas y reseñas sin pasar por la API.
+
+Ejemplos:
+    python bulk.py import movies catalogo.ndjson
+    python bulk.py import reviews reseñas.csv --batch-size 5000
+    python bulk.py export reviews --format csv > respaldo.csv
+"""
+import argparse
+import json
+import sys
+
+from main import (
+    BULK_BATCH_SIZE,
+    IMPORTERS,
+    STREAM_BATCH_SIZE,
+    BulkReader,
+    BulkResult,
+    SessionLocal,
+    export_columns,
+    export_query,
+    format_export_header,
+    format_export_row,
+)
+
+def run_import(kind: str, source, fmt: str, batch_size: int) -> BulkResult:
+    importer = IMPORTERS[kind]
+    reader = BulkReader(fmt, batch_size)
+    result = BulkResult()
+    with SessionLocal() as db:
+        def import_batch(batch):
+            inserted, errors, _ = importer(db, batch)
+            db.commit()
+            result.add(inserted, errors)
+            print(f"{result.inserted} insertados, {result.error_count} errores", file=sys.stderr)
+
+        for line in source:
+            batch = reader.feed(line)
+            if batch:
+                import_batch(batch)
+        batch = reader.finish()
+        if batch:
+            import_batch(batch)
+    return result
+
+def run_export(kind: str, target, fmt: str):
+    columns = export_columns(kind)
+    target.write(format_export_header(fmt, columns))
+    with SessionLocal() as db:
+        rows = db.execute(export_query(kind).execution_options(yield_per=STREAM_BATCH_SIZE)).mappings()
+        for row in rows:
+            target.write(format_export_row(row, fmt, columns))
+
+def detect_format(path: str, requested: str) -> str:
+    if requested:
+        return requested
+    return "csv" if path.endswith(".csv") else "ndjson"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Importa o exporta películas y reseñas en NDJSON o CSV.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="importa un archivo ('-' para stdin)")
+    import_parser.add_argument("kind", choices=sorted(IMPORTERS))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=["ndjson", "csv"])
+    import_parser.add_argument("--batch-size", type=int, default=BULK_BATCH_SIZE)
+
+    export_parser = commands.add_parser("export", help="exporta a un archivo o a stdout")
+    export_parser.add_argument("kind", choices=sorted(IMPORTERS))
+    export_parser.add_argument("path", nargs="?", default="-")
+    export_parser.add_argument("--format", choices=["ndjson", "csv"])
+
+    args = parser.parse_args(argv)
+    fmt = detect_format(args.path, args.format)
+
+    if args.command == "import":
+        source = sys.stdin if args.path == "-" else open(args.path, encoding="utf-8", newline="")
+        with source:
+            result = run_import(args.kind, source, fmt, args.batch_size)
+        json.dump(result.to_dict(), sys.stdout, ensure_ascii=False, indent=2)
+        print()
+        return 1 if result.error_count else 0
+
+    target = sys.stdout if args.path == "-" else open(args.path, "w", encoding="utf-8", newline="")
+    with target:
+        run_export(args.kind, target, fmt)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
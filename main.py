@@ -1,28 +1,273 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Form
-from fastapi.responses import JSONResponse
-from sqlalchemy import create_engine, Column, Integer, String, Float, ForeignKey
+import asyncio
+import base64
+import bisect
+import codecs
+import csv
+import hashlib
+import heapq
+import hmac
+import io
+import json
+import logging
+import math
+import os
+import re
+import secrets
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import FastAPI, Depends, HTTPException, Request, Form, Path, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, inspect, insert, literal, select, update, delete, and_, case, func, or_, text, Column, Index, Integer, String, Float, ForeignKey
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError, field_validator
 from sqlalchemy.orm import Session
 
-app = FastAPI()
+try:
+    from PIL import Image
+except ImportError:  # Pillow es opcional: sin él solo se sirven los originales
+    Image = None
+
+# Configuración de la base de datos (SQLite por defecto, Postgres vía DATABASE_URL)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./movies.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def async_database_url(url: str) -> str:
+    # Driver asíncrono equivalente: aiosqlite para SQLite, asyncpg para Postgres
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    return url
+
+pool_options = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_pre_ping": True,
+}
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
 
-# Configuración de la base de datos SQLite
-DATABASE_URL = "sqlite:///./movies.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# El motor síncrono se usa para crear el esquema y en scripts; los endpoints usan el asíncrono
+engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = create_async_engine(async_database_url(DATABASE_URL), connect_args=connect_args, **pool_options)
+
+# Ajustes de SQLite por conexión: WAL para que los lectores no esperen a los escritores
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+OPTIMIZE_INTERVAL_SECONDS = float(os.getenv("OPTIMIZE_INTERVAL_SECONDS", "3600"))
+SQLITE_ANALYSIS_LIMIT = int(os.getenv("SQLITE_ANALYSIS_LIMIT", "400"))
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", apply_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
 Base = declarative_base()
 
+# Instrumentación: tiempo de BD y de serialización por petición, métricas estilo Prometheus
+QUERY_COUNT_WARNING = int(os.getenv("QUERY_COUNT_WARNING", "20"))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+logger = logging.getLogger("reviewapi")
+
+class RequestTimings:
+    def __init__(self):
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.serialize_seconds = 0.0
+
+request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+def record_serialize_time(seconds: float):
+    timings = request_timings.get()
+    if timings is not None:
+        timings.serialize_seconds += seconds
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    timings = request_timings.get()
+    if timings is not None:
+        timings.db_seconds += time.perf_counter() - started
+        timings.queries += 1
+
+def handle_query_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(_engine, "handle_error", handle_query_error)
+
+@contextmanager
+def timed_db_call():
+    # Todo el tiempo de la llamada cuenta como BD: cursor.execute más la lectura de filas y la
+    # hidratación de objetos, que los eventos del cursor no ven. Sustituye a lo que esos eventos
+    # sumaron dentro para no contarlo dos veces.
+    timings = request_timings.get()
+    if timings is None:
+        yield
+        return
+    db_seconds = timings.db_seconds
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.db_seconds = db_seconds + time.perf_counter() - started
+
+class TimedAsyncSession(AsyncSession):
+    # execute (y scalars, que pasa por él) devuelve resultados ya leídos e hidratados
+    async def execute(self, *args, **kwargs):
+        with timed_db_call():
+            return await super().execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        with timed_db_call():
+            return await super().scalar(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        with timed_db_call():
+            return await super().get(*args, **kwargs)
+
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=TimedAsyncSession, autoflush=False, expire_on_commit=False
+)
+
+def encode_json(payload) -> bytes:
+    # jsonable_encoder recorre los objetos ORM y es la mayor parte del trabajo: se mide con el dumps
+    started = time.perf_counter()
+    body = json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+    record_serialize_time(time.perf_counter() - started)
+    return body
+
+def timed_json(payload, response: Optional[Response] = None) -> Response:
+    # Devolver un Response ya codificado evita que FastAPI vuelva a pasar jsonable_encoder fuera
+    # de la medición; las cabeceras puestas en el Response inyectado se copian
+    headers = dict(response.headers) if response is not None else None
+    return Response(encode_json(payload), media_type="application/json", headers=headers)
+
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        started = time.perf_counter()
+        body = super().render(content)
+        record_serialize_time(time.perf_counter() - started)
+        return body
+
+class Metrics:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.requests = defaultdict(int)  # (método, ruta, status) -> total
+        self.latency = {}  # (método, ruta) -> [conteo por bucket..., suma, total]
+        self.db_seconds = defaultdict(float)
+        self.queries = defaultdict(int)
+
+    def observe(self, method: str, route: str, status: int, seconds: float, timings: RequestTimings):
+        key = (method, route)
+        with self.lock:
+            self.requests[(method, route, status)] += 1
+            histogram = self.latency.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram[index] += 1
+            histogram[-2] += seconds
+            histogram[-1] += 1
+            self.db_seconds[key] += timings.db_seconds
+            self.queries[key] += timings.queries
+
+    def render(self, gauges) -> str:
+        lines = [
+            "# HELP reviewapi_requests_total Peticiones HTTP atendidas.",
+            "# TYPE reviewapi_requests_total counter",
+        ]
+        with self.lock:
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f'reviewapi_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            lines += [
+                "# HELP reviewapi_request_duration_seconds Latencia por ruta.",
+                "# TYPE reviewapi_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self.latency.items()):
+                labels = f'method="{method}",route="{route}"'
+                for bound, count in zip(self.buckets, histogram):
+                    lines.append(f'reviewapi_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'reviewapi_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram[-1]}')
+                lines.append(f"reviewapi_request_duration_seconds_sum{{{labels}}} {histogram[-2]:.6f}")
+                lines.append(f"reviewapi_request_duration_seconds_count{{{labels}}} {histogram[-1]}")
+            lines += [
+                "# HELP reviewapi_db_queries_total Consultas SQL ejecutadas por ruta.",
+                "# TYPE reviewapi_db_queries_total counter",
+            ]
+            for (method, route), count in sorted(self.queries.items()):
+                lines.append(f'reviewapi_db_queries_total{{method="{method}",route="{route}"}} {count}')
+            lines += [
+                "# HELP reviewapi_db_seconds_total Tiempo en la base de datos por ruta.",
+                "# TYPE reviewapi_db_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'reviewapi_db_seconds_total{{method="{method}",route="{route}"}} {seconds:.6f}')
+        for name, value in gauges.items():
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics(LATENCY_BUCKETS)
+
+def server_timing(timings: RequestTimings, total_seconds: float) -> str:
+    app_seconds = max(total_seconds - timings.db_seconds - timings.serialize_seconds, 0.0)
+    return ", ".join([
+        f'db;dur={timings.db_seconds * 1000:.2f};desc="{timings.queries} queries"',
+        f"serialize;dur={timings.serialize_seconds * 1000:.2f}",
+        f"app;dur={app_seconds * 1000:.2f}",
+        f"total;dur={total_seconds * 1000:.2f}",
+    ])
+
 # Modelos de base de datos
 class User(Base):
     __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     email = Column(String, unique=True, index=True)
     password = Column(String)
 
 class Movie(Base):
     __tablename__ = "movies"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     title = Column(String, unique=True, index=True)
     description = Column(String)
     year = Column(Integer)
@@ -34,22 +279,782 @@ class Movie(Base):
 
 class Review(Base):
     __tablename__ = "reviews"
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     content = Column(String)
     rating = Column(Float)
     movie_id = Column(Integer, ForeignKey("movies.id"))
     movie = relationship("Movie", back_populates="reviews")
 
+# Agregados precalculados de las reseñas de cada película
+class MovieStats(Base):
+    __tablename__ = "movie_stats"
+    movie_id = Column(Integer, ForeignKey("movies.id"), primary_key=True)
+    review_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Float, nullable=False, default=0.0)
+    rating_avg = Column(Float, nullable=False, default=0.0, index=True)
+    # Histograma por calificación entera: una columna por bucket para poder incrementarlo en SQL
+    bucket_1 = Column(Integer, nullable=False, default=0)
+    bucket_2 = Column(Integer, nullable=False, default=0)
+    bucket_3 = Column(Integer, nullable=False, default=0)
+    bucket_4 = Column(Integer, nullable=False, default=0)
+    bucket_5 = Column(Integer, nullable=False, default=0)
+    bucket_6 = Column(Integer, nullable=False, default=0)
+    bucket_7 = Column(Integer, nullable=False, default=0)
+    bucket_8 = Column(Integer, nullable=False, default=0)
+    bucket_9 = Column(Integer, nullable=False, default=0)
+    bucket_10 = Column(Integer, nullable=False, default=0)
+
+# Migraciones aplicadas sobre el esquema
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+
+# Índices para las consultas de reseñas por película y películas por género
+ix_reviews_movie_id_id = Index("ix_reviews_movie_id_id", Review.movie_id, Review.id)
+ix_movies_genre = Index("ix_movies_genre", Movie.genre)
+
 # Crear las tablas en la base de datos
 Base.metadata.create_all(bind=engine)
 
-# Dependencia para obtener la sesión de la base de datos
-def get_db():
-    db = SessionLocal()
+# Contraseñas: scrypt con sal aleatoria, en formato scrypt$n$r$p$sal$hash
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+
+def b64encode_text(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+def b64decode_text(value: str) -> bytes:
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(16)
+    digest = hashlib.scrypt(
+        password.encode(), salt=salt, n=PASSWORD_SCRYPT_N, r=PASSWORD_SCRYPT_R, p=PASSWORD_SCRYPT_P, dklen=32
+    )
+    return f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}${b64encode_text(salt)}${b64encode_text(digest)}"
+
+def is_password_hash(value: Optional[str]) -> bool:
+    return bool(value) and value.startswith("scrypt$")
+
+def verify_password(password: str, stored: Optional[str]) -> bool:
     try:
+        algorithm, n, r, p, salt, digest = (stored or "").split("$")
+        expected = b64decode_text(digest)
+        candidate = hashlib.scrypt(
+            password.encode(), salt=b64decode_text(salt), n=int(n), r=int(r), p=int(p), dklen=len(expected)
+        )
+    except ValueError:
+        return False
+    return algorithm == "scrypt" and hmac.compare_digest(candidate, expected)
+
+def migration_review_indexes(connection):
+    # Los índices ix_*_id duplicaban la llave primaria y solo encarecían las escrituras
+    for name in ("ix_users_id", "ix_movies_id", "ix_reviews_id"):
+        connection.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    ix_reviews_movie_id_id.create(connection, checkfirst=True)
+    ix_movies_genre.create(connection, checkfirst=True)
+    connection.execute(text("ANALYZE"))
+
+def migration_atomic_stats(connection):
+    # El histograma JSON no se podía incrementar en SQL; la tabla se recrea y se vuelve a llenar al arrancar
+    columns = {column["name"] for column in inspect(connection).get_columns("movie_stats")}
+    if "histogram" in columns:
+        MovieStats.__table__.drop(connection)
+        MovieStats.__table__.create(connection)
+
+MIGRATIONS = [
+    (1, "review workload indexes", migration_review_indexes),
+    # La 2 hasheaba todas las contraseñas en el arranque; ahora se rehashean en el login
+    (3, "atomic review stats", migration_atomic_stats),
+]
+
+def run_migrations():
+    with engine.begin() as connection:
+        applied = set(connection.scalars(select(SchemaMigration.version)))
+        for version, name, migrate in MIGRATIONS:
+            if version not in applied:
+                migrate(connection)
+                connection.execute(insert(SchemaMigration).values(version=version, name=name))
+
+run_migrations()
+
+# Agregados de reseñas: se mantienen de forma incremental en cada alta/cambio/baja
+RATING_BUCKETS = range(1, 11)
+
+def rating_bucket(rating: float) -> int:
+    return min(10, max(1, int(rating)))
+
+def upsert_stats(db: Session, movie_id: int, count_delta: int, sum_delta: float, bucket_deltas):
+    # Un solo INSERT ... ON CONFLICT DO UPDATE: el incremento lo hace la base, sin leer antes la fila
+    table = MovieStats.__table__
+    dialect_insert = postgresql_insert if engine.dialect.name == "postgresql" else sqlite_insert
+    values = {
+        "movie_id": movie_id,
+        "review_count": count_delta,
+        "rating_sum": sum_delta,
+        "rating_avg": sum_delta / count_delta if count_delta > 0 else 0.0,
+    }
+    values.update({f"bucket_{bucket}": bucket_deltas.get(bucket, 0) for bucket in RATING_BUCKETS})
+    statement = dialect_insert(table).values(**values)
+    new_count = table.c.review_count + statement.excluded.review_count
+    new_sum = table.c.rating_sum + statement.excluded.rating_sum
+    changes = {
+        "review_count": new_count,
+        "rating_sum": new_sum,
+        "rating_avg": case((new_count > 0, new_sum / new_count), else_=0.0),
+    }
+    for bucket in RATING_BUCKETS:
+        column = f"bucket_{bucket}"
+        if bucket_deltas.get(bucket):
+            changes[column] = table.c[column] + statement.excluded[column]
+    db.execute(statement.on_conflict_do_update(index_elements=[table.c.movie_id], set_=changes))
+
+def apply_review_to_stats(db: Session, movie_id: int, rating: float, sign: int = 1):
+    upsert_stats(db, movie_id, sign, sign * rating, {rating_bucket(rating): sign})
+
+def apply_rating_change(db: Session, movie_id: int, old_rating: float, new_rating: float):
+    bucket_deltas = defaultdict(int)
+    bucket_deltas[rating_bucket(old_rating)] -= 1
+    bucket_deltas[rating_bucket(new_rating)] += 1
+    upsert_stats(db, movie_id, 0, new_rating - old_rating, bucket_deltas)
+
+def apply_reviews_to_stats(db: Session, reviews):
+    # reviews: pares (movie_id, rating); un upsert por película en vez de uno por reseña
+    totals = defaultdict(lambda: [0, 0.0, defaultdict(int)])
+    for movie_id, rating in reviews:
+        total = totals[movie_id]
+        total[0] += 1
+        total[1] += rating
+        total[2][rating_bucket(rating)] += 1
+    for movie_id, (count, rating_sum, bucket_deltas) in totals.items():
+        upsert_stats(db, movie_id, count, rating_sum, bucket_deltas)
+
+def bucket_condition(bucket: int):
+    if bucket == RATING_BUCKETS[0]:
+        return Review.rating < bucket + 1
+    if bucket == RATING_BUCKETS[-1]:
+        return Review.rating >= bucket
+    return and_(Review.rating >= bucket, Review.rating < bucket + 1)
+
+def rebuild_movie_stats(db: Session):
+    # Calcula en SQL (GROUP BY) los agregados de las películas que aún no tienen fila
+    missing = db.execute(
+        select(
+            Review.movie_id,
+            func.count(),
+            func.sum(Review.rating),
+            *(func.sum(case((bucket_condition(bucket), 1), else_=0)) for bucket in RATING_BUCKETS),
+        )
+        .outerjoin(MovieStats, MovieStats.movie_id == Review.movie_id)
+        .where(MovieStats.movie_id.is_(None), Review.movie_id.isnot(None))
+        .group_by(Review.movie_id)
+    ).all()
+    for movie_id, count, rating_sum, *buckets in missing:
+        upsert_stats(db, movie_id, count, rating_sum, dict(zip(RATING_BUCKETS, buckets)))
+    db.commit()
+
+def stats_to_dict(movie_id: int, stats: Optional[MovieStats]):
+    if stats is None:
+        return {"movie_id": movie_id, "review_count": 0, "average": None, "histogram": {}}
+    histogram = {str(bucket): getattr(stats, f"bucket_{bucket}") for bucket in RATING_BUCKETS}
+    return {
+        "movie_id": movie_id,
+        "review_count": stats.review_count,
+        "average": round(stats.rating_avg, 2) if stats.review_count else None,
+        "histogram": {bucket: count for bucket, count in histogram.items() if count},
+    }
+
+with SessionLocal() as _db:
+    rebuild_movie_stats(_db)
+
+# Búsqueda de texto completo: FTS5 en SQLite, índice invertido en memoria como respaldo
+def normalize_text(value: Optional[str]) -> str:
+    # Minúsculas y sin acentos, para que "leon" encuentre "El Rey León"
+    decomposed = unicodedata.normalize("NFKD", value or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+def tokenize(value: Optional[str]):
+    return re.findall(r"\w+", normalize_text(value))
+
+class FTS5SearchIndex:
+    # Una tabla por tipo con rowid = id de la entidad: altas, cambios y bajas van por rowid, sin escanear
+    TABLES = {"movie": "movies_fts", "review": "reviews_fts"}
+
+    def create(self, db: Session) -> bool:
+        # Devuelve True si las tablas se acaban de crear y hay que poblarlas
+        exists = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'movies_fts'")
+        ).first()
+        db.execute(text("DROP TABLE IF EXISTS search_index"))
+        db.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5("
+            "title, body, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        db.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts USING fts5("
+            "body, tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+        return exists is None
+
+    def insert_statement(self, kind: str):
+        if kind == "movie":
+            return text("INSERT INTO movies_fts (rowid, title, body) VALUES (:ref_id, :title, :body)")
+        return text("INSERT INTO reviews_fts (rowid, body) VALUES (:ref_id, :body)")
+
+    def add(self, db: Session, kind: str, ref_id: int, title: str, body: str):
+        db.execute(self.insert_statement(kind), {"ref_id": ref_id, "title": title or "", "body": body or ""})
+
+    def replace(self, db: Session, kind: str, ref_id: int, title: str, body: str):
+        self.remove(db, kind, ref_id)
+        self.add(db, kind, ref_id, title, body)
+
+    def add_many(self, db: Session, documents):
+        # Documentos nuevos: un executemany por tipo, sin borrar antes
+        by_kind = defaultdict(list)
+        for kind, ref_id, title, body in documents:
+            by_kind[kind].append({"ref_id": ref_id, "title": title or "", "body": body or ""})
+        for kind, rows in by_kind.items():
+            db.execute(self.insert_statement(kind), rows)
+
+    def remove(self, db: Session, kind: str, ref_id: int):
+        db.execute(text(f"DELETE FROM {self.TABLES[kind]} WHERE rowid = :ref_id"), {"ref_id": ref_id})
+
+    def search(self, db: Session, query: str, limit: int, kind: Optional[str] = None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        # Cada término como prefijo: "aveng" -> "aveng"*
+        match = " ".join(f'"{term}"*' for term in terms)
+        selects = []
+        if kind in (None, "movie"):
+            selects.append("SELECT 'movie' AS kind, rowid AS ref_id, -bm25(movies_fts, 10.0, 1.0) AS score "
+                           "FROM movies_fts WHERE movies_fts MATCH :match")
+        if kind in (None, "review"):
+            selects.append("SELECT 'review' AS kind, rowid AS ref_id, -bm25(reviews_fts) AS score "
+                           "FROM reviews_fts WHERE reviews_fts MATCH :match")
+        sql = " UNION ALL ".join(selects) + " ORDER BY score DESC LIMIT :limit"
+        rows = db.execute(text(sql), {"match": match, "limit": limit})
+        return [(row.kind, int(row.ref_id), row.score) for row in rows]
+
+class MemorySearchIndex:
+    TITLE_WEIGHT = 10.0
+
+    def __init__(self):
+        self.postings = defaultdict(dict)  # término -> {(kind, ref_id): peso}
+        self.documents = {}  # (kind, ref_id) -> términos del documento
+        self.vocabulary = []  # términos ordenados para buscar por prefijo
+
+    def create(self, db: Session) -> bool:
+        return True
+
+    def add(self, db: Session, kind: str, ref_id: int, title: str, body: str):
+        self.remove(db, kind, ref_id)
+        key = (kind, ref_id)
+        weights = defaultdict(float)
+        for term in tokenize(title):
+            weights[term] += self.TITLE_WEIGHT
+        for term in tokenize(body):
+            weights[term] += 1.0
+        for term, weight in weights.items():
+            if term not in self.postings:
+                bisect.insort(self.vocabulary, term)
+            self.postings[term][key] = weight
+        self.documents[key] = list(weights)
+
+    def replace(self, db: Session, kind: str, ref_id: int, title: str, body: str):
+        self.add(db, kind, ref_id, title, body)
+
+    def add_many(self, db: Session, documents):
+        for document in documents:
+            self.add(db, *document)
+
+    def remove(self, db: Session, kind: str, ref_id: int):
+        key = (kind, ref_id)
+        for term in self.documents.pop(key, []):
+            postings = self.postings[term]
+            postings.pop(key, None)
+            if not postings:
+                del self.postings[term]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, term)]
+
+    def expand(self, prefix: str):
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        for term in self.vocabulary[start:]:
+            if not term.startswith(prefix):
+                break
+            yield term
+
+    def search(self, db: Session, query: str, limit: int, kind: Optional[str] = None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        total = len(self.documents) or 1
+        scores = None
+        for prefix in terms:
+            matched = defaultdict(float)
+            for term in self.expand(prefix):
+                postings = self.postings[term]
+                idf = math.log(1 + total / len(postings))
+                for key, weight in postings.items():
+                    if kind is None or key[0] == kind:
+                        matched[key] += weight * idf
+            # Todos los términos deben aparecer (AND), igual que en FTS5
+            if scores is None:
+                scores = matched
+            else:
+                scores = {key: score + matched[key] for key, score in scores.items() if key in matched}
+            if not scores:
+                return []
+        ranked = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(key[0], key[1], score) for key, score in ranked]
+
+def create_search_index(db: Session):
+    if engine.dialect.name == "sqlite":
+        try:
+            index = FTS5SearchIndex()
+            return index, index.create(db)
+        except OperationalError:
+            db.rollback()  # SQLite compilado sin FTS5
+    index = MemorySearchIndex()
+    return index, index.create(db)
+
+def index_movie(db: Session, movie: Movie):
+    search_index.add(db, "movie", movie.id, movie.title, movie.description)
+
+def reindex_movie(db: Session, movie: Movie):
+    search_index.replace(db, "movie", movie.id, movie.title, movie.description)
+
+def index_review(db: Session, review: Review):
+    search_index.add(db, "review", review.id, "", review.content)
+
+def reindex_review(db: Session, review: Review):
+    search_index.replace(db, "review", review.id, "", review.content)
+
+def unindex(db: Session, kind: str, ref_id: int):
+    search_index.remove(db, kind, ref_id)
+
+SEARCH_REBUILD_BATCH_SIZE = 1000
+
+def rebuild_search_index(db: Session):
+    # Se recorre por lotes (yield_per) en lugar de cargar las tablas completas
+    queries = [
+        select(literal("movie"), Movie.id, Movie.title, Movie.description),
+        select(literal("review"), Review.id, literal(""), Review.content),
+    ]
+    for query in queries:
+        rows = db.execute(query.execution_options(yield_per=SEARCH_REBUILD_BATCH_SIZE))
+        for batch in rows.partitions():
+            search_index.add_many(db, [tuple(row) for row in batch])
+    db.commit()
+
+with SessionLocal() as _db:
+    search_index, _needs_rebuild = create_search_index(_db)
+    if _needs_rebuild:
+        rebuild_search_index(_db)
+    _db.commit()
+
+# Dependencia para obtener la sesión de la base de datos
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+# Paginación por cursor (keyset) y streaming NDJSON
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+
+def encode_cursor(last_id: int) -> str:
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    if not cursor:
+        return 0
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(cursor + padding).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def row_to_dict(obj):
+    return {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+
+async def paginate(db: AsyncSession, model, limit: int, cursor: Optional[str], request: Request, response: Response):
+    # WHERE id > last_id ORDER BY id LIMIT n: usa la llave primaria, sin OFFSET
+    last_id = decode_cursor(cursor)
+    result = await db.scalars(
+        select(model).where(model.id > last_id).order_by(model.id).limit(limit + 1)
+    )
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id)
+        next_url = request.url.include_query_params(cursor=next_cursor, limit=limit)
+        response.headers["X-Next-Cursor"] = next_cursor
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return rows
+
+def stream_ndjson(model, cursor: Optional[str] = None, batch_size: int = STREAM_BATCH_SIZE, serialize=row_to_dict):
+    last_id = decode_cursor(cursor)
+
+    # La sesión vive lo mismo que el stream, no lo que dura el endpoint
+    async def generate():
+        async with AsyncSessionLocal() as db:
+            rows = await db.stream_scalars(
+                select(model)
+                .where(model.id > last_id)
+                .order_by(model.id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for row in rows:
+                yield json.dumps(serialize(row), ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+# Caché de lecturas en proceso (LRU + TTL) con invalidación al escribir
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+
+CacheEntry = namedtuple("CacheEntry", ["body", "etag", "expires_at"])
+
+class ReadCache:
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.stale_sets = 0
+        # Generación por clave: invalidate la sube y set descarta lo leído antes de la invalidación.
+        # Se guardan como mucho max_entries; al descartar una, floor sube y las lecturas previas
+        # de esa clave se tratan como obsoletas.
+        self.clock = 0
+        self.generations = OrderedDict()
+        self.floor = 0
+
+    def generation(self, key) -> int:
+        with self.lock:
+            return self.generations.get(key, self.floor)
+
+    def get(self, key) -> Optional[CacheEntry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.expires_at <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, payload, generation: Optional[int] = None) -> CacheEntry:
+        # Se guarda el JSON ya serializado: los aciertos no vuelven a serializar.
+        # generation es la de la clave al fallar la lectura; si cambió, el payload puede ser
+        # anterior a una escritura y se devuelve sin guardarlo.
+        body = encode_json(payload)
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        entry = CacheEntry(body, etag, time.monotonic() + self.ttl)
+        with self.lock:
+            if generation is not None and self.generations.get(key, self.floor) != generation:
+                self.stale_sets += 1
+                return entry
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.clock += 1
+                self.generations[key] = self.clock
+                self.generations.move_to_end(key)
+                if self.entries.pop(key, None) is not None:
+                    self.invalidations += 1
+            while len(self.generations) > self.max_entries:
+                _, self.floor = self.generations.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "stale_sets": self.stale_sets,
+            }
+
+read_cache = ReadCache(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS)
+
+def invalidate_movie_cache(movie_id: int, *movies):
+    # movies: estados (título, género) antes y/o después del cambio
+    keys = [("movie", movie_id)]
+    for title, genre in movies:
+        keys += [("title", title), ("genre", genre), ("reviews", title)]
+    read_cache.invalidate(*keys)
+
+async def invalidate_reviews_cache(db: AsyncSession, movie_id: Optional[int]):
+    movie = await db.get(Movie, movie_id) if movie_id is not None else None
+    if movie is not None:
+        read_cache.invalidate(("reviews", movie.title))
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def cached_response(request: Request, entry: CacheEntry) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request, entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+# Pósters: archivos de images/ con ETag fuerte, Range y miniaturas en caché de disco
+IMAGES_DIR = os.path.abspath(os.getenv("IMAGES_DIR", "images"))
+THUMBNAIL_CACHE_DIR = os.path.abspath(os.getenv("THUMBNAIL_CACHE_DIR", ".thumbnails"))
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+THUMBNAIL_WIDTHS = (160, 320, 640)
+THUMBNAIL_QUALITY = 80
+IMAGE_CACHE_CONTROL = "public, max-age=86400"
+
+file_etags = {}  # ruta -> ((mtime_ns, tamaño), etag)
+
+def file_etag(path: str, stat_result: os.stat_result) -> str:
+    # ETag fuerte a partir del contenido; solo se recalcula si cambia mtime o tamaño
+    version = (stat_result.st_mtime_ns, stat_result.st_size)
+    cached = file_etags.get(path)
+    if cached and cached[0] == version:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    etag = '"' + digest.hexdigest()[:32] + '"'
+    file_etags[path] = (version, etag)
+    return etag
+
+def resolve_image_path(filename: str) -> str:
+    path = os.path.abspath(os.path.join(IMAGES_DIR, filename))
+    if os.path.dirname(path) != IMAGES_DIR or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return path
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if request.headers.get("if-none-match"):
+        return etag_matches(request, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if not if_modified_since:
+        return False
+    try:
+        return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+class ThumbnailCache:
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.total_bytes = None
+        self.lock = threading.Lock()
+
+    def get_or_create(self, source: str, source_etag: str, width: int) -> str:
+        if Image is None:
+            raise HTTPException(status_code=501, detail="Thumbnails require Pillow")
+        stem = os.path.splitext(os.path.basename(source))[0]
+        path = os.path.join(self.directory, f"{stem}-{width}-{source_etag.strip(chr(34))[:16]}.jpg")
+        if os.path.exists(path):
+            os.utime(path)  # marca de uso para el desalojo LRU
+            return path
+        os.makedirs(self.directory, exist_ok=True)
+        with Image.open(source) as image:
+            # draft() decodifica el JPEG ya reducido, mucho más rápido que abrirlo completo
+            image.draft("RGB", (width, width * 4))
+            image = image.convert("RGB")
+            image.thumbnail((width, width * 4))
+            partial_path = f"{path}.{threading.get_ident()}.tmp"
+            image.save(partial_path, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+        os.replace(partial_path, path)
+        self.added(path, os.path.getsize(path))
+        return path
+
+    def added(self, path: str, size: int):
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+            else:
+                self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self.evict(keep=path)
+
+    def evict(self, keep: str):
+        # Borra las menos usadas hasta quedar en el 90% del límite
+        entries = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.name.endswith(".jpg") and entry.path != keep
+        )
+        for _, size, path in entries:
+            if self.total_bytes <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+
+async def serve_file(request: Request, path: str) -> Response:
+    stat_result = await run_in_threadpool(os.stat, path)
+    etag = await run_in_threadpool(file_etag, path, stat_result)
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if not_modified(request, etag, stat_result.st_mtime):
+        headers["Last-Modified"] = formatdate(stat_result.st_mtime, usegmt=True)
+        return Response(status_code=304, headers=headers)
+    # FileResponse atiende Range/If-Range y usa pathsend (sin copias) si el servidor lo soporta
+    return FileResponse(path, headers=headers, stat_result=stat_result)
+
+async def image_response(request: Request, filename: str, width: Optional[int]) -> Response:
+    if width is not None and width not in THUMBNAIL_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"width must be one of {list(THUMBNAIL_WIDTHS)}")
+    path = resolve_image_path(filename)
+    if width is not None:
+        stat_result = await run_in_threadpool(os.stat, path)
+        source_etag = await run_in_threadpool(file_etag, path, stat_result)
+        path = await run_in_threadpool(thumbnail_cache.get_or_create, path, source_etag, width)
+    return await serve_file(request, path)
+
+# Hash de contraseñas fuera del event loop, con un pool acotado para que el login sea predecible
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(os.cpu_count() or 2)))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "256"))
+
+class PasswordHasher:
+    def __init__(self, workers: int, max_pending: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password")
+        self.max_pending = max_pending
+        self.pending = 0
+        # Hash de referencia para que un email inexistente tarde lo mismo que uno válido
+        self.dummy_hash = hash_password(secrets.token_urlsafe(16))
+
+    async def run(self, function, *args):
+        if self.pending >= self.max_pending:
+            raise HTTPException(
+                status_code=429, detail="Too many login attempts, try again later", headers={"Retry-After": "1"}
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(hash_password, password)
+
+    async def verify(self, password: str, stored: Optional[str]) -> bool:
+        if stored and not is_password_hash(stored):
+            # Contraseña heredada en texto plano: se gasta el mismo scrypt para no delatarla por tiempo
+            await self.run(verify_password, password, self.dummy_hash)
+            return hmac.compare_digest(password.encode(), stored.encode())
+        return await self.run(verify_password, password, stored or self.dummy_hash)
+
+password_hasher = PasswordHasher(PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING)
+
+# Tokens firmados (HMAC-SHA256): se validan sin consultar la base de datos
+TOKEN_TTL_SECONDS = int(os.getenv("TOKEN_TTL_SECONDS", "3600"))
+TOKEN_SECRET = os.getenv("TOKEN_SECRET", "").encode()
+if not TOKEN_SECRET:
+    logger.warning("TOKEN_SECRET is not set; tokens will not survive a restart or work across workers")
+    TOKEN_SECRET = secrets.token_bytes(32)
+
+def sign_token(payload: str) -> str:
+    return b64encode_text(hmac.new(TOKEN_SECRET, payload.encode(), hashlib.sha256).digest())
+
+def create_token(user: User):
+    now = int(time.time())
+    claims = {"sub": user.id, "email": user.email, "iat": now, "exp": now + TOKEN_TTL_SECONDS, "jti": secrets.token_urlsafe(12)}
+    payload = b64encode_text(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{sign_token(payload)}", claims
+
+class TokenRevocations:
+    # Tokens cerrados con /logout/; cada entrada caduca junto con su token
+    def __init__(self):
+        self.revoked = {}  # jti -> exp
+        self.lock = threading.Lock()
+        self.next_purge = 0.0
+
+    def revoke(self, jti: str, expires_at: int):
+        with self.lock:
+            self.revoked[jti] = expires_at
+            self.purge()
+
+    def is_revoked(self, jti: str) -> bool:
+        with self.lock:
+            self.purge()
+            return jti in self.revoked
+
+    def purge(self):
+        now = time.time()
+        if now < self.next_purge:
+            return
+        self.revoked = {jti: exp for jti, exp in self.revoked.items() if exp > now}
+        self.next_purge = now + 60
+
+token_revocations = TokenRevocations()
+
+def invalid_token(detail: str = "Invalid token") -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+def verify_token(token: str) -> dict:
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature.encode(), sign_token(payload).encode()):
+        raise invalid_token()
+    try:
+        claims = json.loads(b64decode_text(payload))
+    except ValueError:
+        raise invalid_token()
+    if claims.get("exp", 0) <= time.time():
+        raise invalid_token("Token expired")
+    if token_revocations.is_revoked(claims.get("jti")):
+        raise invalid_token("Token revoked")
+    return claims
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> dict:
+    if credentials is None:
+        raise invalid_token("Not authenticated")
+    return verify_token(credentials.credentials)
+
+def public_user(user: User):
+    return {"id": user.id, "email": user.email}
+
+def login_payload(user: User, message: str):
+    token, claims = create_token(user)
+    return {
+        "userId": user.id,
+        "isLogged": True,
+        "message": message,
+        "token": token,
+        "token_type": "bearer",
+        "expires_in": claims["exp"] - claims["iat"],
+    }
 
 # Modelos Pydantic
 class UserCreate(BaseModel):
@@ -72,59 +1077,419 @@ class ReviewCreate(BaseModel):
     content: str
     rating: float = Field(..., ge=1, le=10)
 
-# Middleware para manejo global de excepciones
+# Carga y exportación masiva (NDJSON o CSV), compartida por la API y bulk.py
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+BULK_MAX_REPORTED_ERRORS = 1000
+BULK_CSV_MAX_RECORD_LINES = int(os.getenv("BULK_CSV_MAX_RECORD_LINES", "1000"))
+BULK_INSERT_CHUNK = 500  # filas por INSERT multi-VALUES, lejos del límite de parámetros de SQLite
+
+class MovieImport(MovieCreate):
+    # La columna admite NULL y la exportación lo escribe tal cual
+    image_url: Optional[str] = None
+
+class ReviewImport(ReviewCreate):
+    title: Optional[str] = None
+    movie_id: Optional[int] = None
+
+    @field_validator("title", "movie_id", mode="before")
+    @classmethod
+    def empty_as_missing(cls, value):
+        # En CSV una celda vacía de estos campos de búsqueda significa "no viene"
+        return None if value == "" else value
+
+def bulk_format(requested: Optional[str], content_type: Optional[str]) -> str:
+    if requested:
+        return requested
+    return "csv" if content_type and "csv" in content_type else "ndjson"
+
+def format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc']) or 'row'}: {error['msg']}" for error in exc.errors()
+    )
+
+class PendingLines(deque):
+    # Cola de líneas que un único csv.reader va consumiendo a medida que llegan
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self:
+            raise StopIteration
+        return self.popleft()
+
+def csv_quote_open(line: str, inside: bool) -> bool:
+    # Sigue las reglas de csv: una comilla solo abre un campo entrecomillado si está al inicio
+    # del campo; en mitad de un campo sin comillas es un carácter más. Devuelve si la línea
+    # termina dentro de un campo entrecomillado (el registro sigue en la línea siguiente).
+    state = "quoted" if inside else "start"
+    for char in line:
+        if state == "quoted":
+            if char == '"':
+                state = "closing"
+        elif state == "closing":
+            # "" dentro de comillas es una comilla escapada
+            state = "quoted" if char == '"' else "start" if char == "," else "field"
+        elif char == ",":
+            state = "start"
+        elif state == "start" and char == '"':
+            state = "quoted"
+        elif char in "\r\n":
+            state = "start"
+        else:
+            state = "field"
+    return state == "quoted"
+
+class BulkReader:
+    # Convierte líneas en lotes de (línea, registro, error) sin cargar todo el archivo
+    def __init__(self, fmt: str, batch_size: int = BULK_BATCH_SIZE):
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.header = None
+        self.line_no = 0
+        self.batch = []
+        # CSV: un campo entre comillas puede ocupar varias líneas físicas, así que las líneas se
+        # acumulan hasta que el registro se cierra y entonces se lee con un único csv.reader.
+        # Un registro que no se cierra en BULK_CSV_MAX_RECORD_LINES se descarta con su error.
+        self.pending = PendingLines()
+        self.rows = csv.reader(self.pending)
+        self.record_line = 0
+        self.inside_quotes = False
+
+    def feed(self, line: str):
+        self.line_no += 1
+        if self.fmt == "csv":
+            return self.feed_csv(line)
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            return None
+        self.batch.append(self.parse(line))
+        return self.take_full_batch()
+
+    def feed_csv(self, line: str):
+        if not self.pending:
+            if not line.strip():
+                return None
+            self.record_line = self.line_no
+        self.pending.append(line if line.endswith("\n") else line + "\n")
+        self.inside_quotes = csv_quote_open(line, self.inside_quotes)
+        if self.inside_quotes:
+            if len(self.pending) < BULK_CSV_MAX_RECORD_LINES:
+                return None
+            self.discard_pending()
+            self.batch.append((
+                self.record_line, None, f"invalid csv: quoted field spans more than {BULK_CSV_MAX_RECORD_LINES} lines"
+            ))
+            return self.take_full_batch()
+        try:
+            values = next(self.rows)
+        except csv.Error as exc:
+            self.discard_pending()
+            if self.header is None:
+                self.header = []
+            self.batch.append((self.record_line, None, f"invalid csv: {exc}"))
+            return self.take_full_batch()
+        if self.header is None:
+            self.header = values
+            return None
+        record = dict(zip(self.header, values))
+        self.batch.append((self.record_line, record, None))
+        return self.take_full_batch()
+
+    def parse(self, line: str):
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("expected an object")
+            return self.line_no, record, None
+        except ValueError as exc:
+            return self.line_no, None, f"invalid {self.fmt}: {exc}"
+
+    def discard_pending(self):
+        self.pending.clear()
+        self.inside_quotes = False
+
+    def take_full_batch(self):
+        if len(self.batch) >= self.batch_size:
+            return self.take()
+        return None
+
+    def take(self):
+        batch, self.batch = self.batch, []
+        return batch
+
+    def finish(self):
+        # Fin de la entrada: un registro CSV a medias es un campo entre comillas sin cerrar
+        if self.pending:
+            self.discard_pending()
+            self.batch.append((self.record_line, None, f"invalid {self.fmt}: unterminated quoted field"))
+        return self.take()
+
+class BulkResult:
+    def __init__(self):
+        self.inserted = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add(self, inserted: int, errors):
+        errors = sorted(errors, key=lambda error: error["line"])
+        self.inserted += inserted
+        self.error_count += len(errors)
+        room = BULK_MAX_REPORTED_ERRORS - len(self.errors)
+        self.errors.extend(errors[:max(room, 0)])
+
+    def to_dict(self):
+        return {"inserted": self.inserted, "error_count": self.error_count, "errors": self.errors}
+
+def statement_savepoint(db: Session):
+    # En SQLite un INSERT fallido solo deshace esa sentencia; en otros motores aborta la
+    # transacción, así que cada intento va dentro de un SAVEPOINT
+    if db.get_bind().dialect.name == "sqlite":
+        return nullcontext()
+    return db.begin_nested()
+
+def insert_batch(db: Session, model, rows):
+    # Cada trozo del lote va en un único INSERT ... VALUES (...), (...) RETURNING: una sentencia
+    # atómica que devuelve ids y columnas sin depender del orden. Si la base rechaza un trozo,
+    # se reintenta fila a fila para reportar solo las que fallan.
+    table = model.__table__
+    inserted, errors = [], []
+    for start in range(0, len(rows), BULK_INSERT_CHUNK):
+        chunk = rows[start:start + BULK_INSERT_CHUNK]
+        try:
+            with statement_savepoint(db):
+                result = db.execute(insert(table).values([values for _, values in chunk]).returning(*table.columns))
+                inserted.extend(dict(row) for row in result.mappings())
+            continue
+        except IntegrityError:
+            pass
+        for line_no, values in chunk:
+            try:
+                with statement_savepoint(db):
+                    row = db.execute(insert(table).values(values).returning(*table.columns)).mappings().one()
+                inserted.append(dict(row))
+            except IntegrityError as exc:
+                errors.append({"line": line_no, "error": str(exc.orig)})
+    return inserted, errors
+
+def import_movie_batch(db: Session, batch):
+    errors, movies, seen = [], [], set()
+    for line_no, record, error in batch:
+        if error:
+            errors.append({"line": line_no, "error": error})
+            continue
+        try:
+            movie = MovieImport.model_validate(record)
+        except ValidationError as exc:
+            errors.append({"line": line_no, "error": format_validation_error(exc)})
+            continue
+        if movie.title in seen:
+            errors.append({"line": line_no, "error": "duplicate title in batch"})
+            continue
+        seen.add(movie.title)
+        movies.append((line_no, movie))
+
+    existing = set(db.scalars(select(Movie.title).where(Movie.title.in_(seen)))) if seen else set()
+    rows = []
+    for line_no, movie in movies:
+        if movie.title in existing:
+            errors.append({"line": line_no, "error": "movie already exists"})
+            continue
+        rows.append((line_no, movie.model_dump()))
+
+    inserted, failed = insert_batch(db, Movie, rows)
+    errors.extend(failed)
+    search_index.add_many(db, [
+        ("movie", movie["id"], movie["title"], movie["description"]) for movie in inserted
+    ])
+    cache_keys = []
+    for movie in inserted:
+        cache_keys += [("title", movie["title"]), ("genre", movie["genre"])]
+    return len(inserted), errors, cache_keys
+
+def import_review_batch(db: Session, batch):
+    errors, reviews = [], []
+    for line_no, record, error in batch:
+        if error:
+            errors.append({"line": line_no, "error": error})
+            continue
+        try:
+            review = ReviewImport.model_validate(record)
+        except ValidationError as exc:
+            errors.append({"line": line_no, "error": format_validation_error(exc)})
+            continue
+        if review.title is None and review.movie_id is None:
+            errors.append({"line": line_no, "error": "title or movie_id is required"})
+            continue
+        reviews.append((line_no, review))
+
+    # Los títulos se resuelven a ids una sola vez por lote. Si viene el título manda sobre
+    # movie_id: un respaldo restaurado en otra base conserva títulos, no ids.
+    titles = {review.title for _, review in reviews if review.title is not None}
+    ids = {review.movie_id for _, review in reviews if review.title is None}
+    by_title, by_id = {}, {}
+    if titles or ids:
+        query = select(Movie.id, Movie.title).where(or_(Movie.title.in_(titles), Movie.id.in_(ids)))
+        for movie_id, title in db.execute(query):
+            by_title[title] = movie_id
+            by_id[movie_id] = title
+
+    rows = []
+    for line_no, review in reviews:
+        movie_id = by_title.get(review.title) if review.title is not None else review.movie_id
+        if movie_id not in by_id:
+            errors.append({"line": line_no, "error": "Movie not found"})
+            continue
+        rows.append((line_no, {"content": review.content, "rating": review.rating, "movie_id": movie_id}))
+
+    inserted, failed = insert_batch(db, Review, rows)
+    errors.extend(failed)
+    apply_reviews_to_stats(db, [(review["movie_id"], review["rating"]) for review in inserted])
+    search_index.add_many(db, [
+        ("review", review["id"], "", review["content"]) for review in inserted
+    ])
+    cache_keys = list({("reviews", by_id[review["movie_id"]]) for review in inserted})
+    return len(inserted), errors, cache_keys
+
+IMPORTERS = {"movies": import_movie_batch, "reviews": import_review_batch}
+
+def export_query(kind: str):
+    if kind == "movies":
+        return select(*Movie.__table__.columns).order_by(Movie.id)
+    return (
+        select(*Review.__table__.columns, Movie.title.label("title"))
+        .outerjoin(Movie, Movie.id == Review.movie_id)
+        .order_by(Review.id)
+    )
+
+def export_columns(kind: str):
+    columns = [column.name for column in (Movie if kind == "movies" else Review).__table__.columns]
+    return columns if kind == "movies" else columns + ["title"]
+
+def format_export_row(row, fmt: str, columns) -> str:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerow(
+            ["" if row[column] is None else row[column] for column in columns]
+        )
+        return buffer.getvalue()
+    return json.dumps(dict(row), ensure_ascii=False) + "\n"
+
+def format_export_header(fmt: str, columns) -> str:
+    return ",".join(columns) + "\n" if fmt == "csv" else ""
+
+# Estadísticas del planificador: PRAGMA optimize periódico mientras la app está arriba. Solo
+# reanaliza las tablas que lo necesitan y, con analysis_limit, muestrea en lugar de recorrerlas
+# enteras, así que no retiene el bloqueo de escritura como un ANALYZE completo (que queda solo
+# en la migración 1). En otros motores se deja al autovacuum.
+async def optimize_periodically(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        # Un fallo puntual (p. ej. "database is locked" durante una carga masiva) no detiene la tarea
+        try:
+            async with async_engine.begin() as connection:
+                await connection.exec_driver_sql(f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}")
+                await connection.exec_driver_sql("PRAGMA optimize")
+        except Exception:
+            logger.exception("PRAGMA optimize failed; retrying in %gs", interval)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    optimizer = None
+    if engine.dialect.name == "sqlite" and OPTIMIZE_INTERVAL_SECONDS > 0:
+        optimizer = asyncio.create_task(optimize_periodically(OPTIMIZE_INTERVAL_SECONDS))
+    try:
+        yield
+    finally:
+        if optimizer:
+            optimizer.cancel()
+        password_hasher.executor.shutdown(wait=False)
+        await async_engine.dispose()
+
+app = FastAPI(lifespan=lifespan, default_response_class=TimedJSONResponse)
+
+# Middleware de tiempos por petición y manejo global de excepciones
 @app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
+    timings = RequestTimings()
+    request_timings.set(timings)
+    started = time.perf_counter()
     try:
         response = await call_next(request)
-        return response
     except Exception as exc:
-        return JSONResponse(
+        response = JSONResponse(
             status_code=500,
             content={"message": "An unexpected error occurred.", "details": str(exc)},
         )
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    metrics.observe(request.method, route_path, response.status_code, elapsed, timings)
+    if timings.queries > QUERY_COUNT_WARNING:
+        logger.warning("%s %s ran %d SQL queries (possible N+1)", request.method, route_path, timings.queries)
+
+    response.headers["X-Process-Time"] = f"{elapsed:.6f}"
+    response.headers["X-Query-Count"] = str(timings.queries)
+    response.headers["Server-Timing"] = server_timing(timings, elapsed)
+    return response
 
 # Endpoints de la API
 @app.post("/user/")
-def register_user(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = User(email=user.email, password=user.password)
+async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = User(email=user.email, password=await password_hasher.hash(user.password))
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return {
-        "userId": db_user.id,
-        "isLogged": True,
-        "message": "Usuario creado correctamente"
-    }
+    await db.commit()
+    await db.refresh(db_user)
+    return login_payload(db_user, "Usuario creado correctamente")
 
 @app.post("/login/")
-def login_user(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.email == user.email).first()
-    if not db_user or db_user.password != user.password:
+async def login_user(user: UserLogin, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(User).where(User.email == user.email))
+    password_ok = await password_hasher.verify(user.password, db_user.password if db_user else None)
+    if not db_user or not password_ok:
         return {
             "userId": 0,
             "isLogged": False,
             "message": "Usuario o contraseña incorrectos"
         }
-    return {
-        "userId": db_user.id,
-        "isLogged": True,
-        "message": "Bienvenido"
-    }
+    if not is_password_hash(db_user.password):
+        # Las contraseñas en texto plano se migran a scrypt en su primer login correcto
+        db_user.password = await password_hasher.hash(user.password)
+        await db.commit()
+    return login_payload(db_user, "Bienvenido")
+
+@app.post("/logout/")
+async def logout_user(current_user: dict = Depends(get_current_user)):
+    token_revocations.revoke(current_user["jti"], current_user["exp"])
+    return {"userId": current_user["sub"], "isLogged": False, "message": "Sesión cerrada"}
+
+@app.get("/users/me")
+async def get_me(current_user: dict = Depends(get_current_user)):
+    return {"id": current_user["sub"], "email": current_user["email"], "expires_at": current_user["exp"]}
 
 @app.get("/users/")
-def get_users(db: Session = Depends(get_db)):
-    return db.query(User).all()
+async def get_users(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    if stream:
+        return stream_ndjson(User, cursor, serialize=public_user)
+    users = await paginate(db, User, limit, cursor, request, response)
+    return timed_json([public_user(user) for user in users], response)
 
 @app.get("/users/{user_id}")
-def get_user(user_id: int, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.id == user_id).first()
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
+    db_user = await db.scalar(select(User).where(User.id == user_id))
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return public_user(db_user)
 
 @app.post("/movies/")
-def create_movie(movie: MovieCreate, db: Session = Depends(get_db)):
+async def create_movie(movie: MovieCreate, db: AsyncSession = Depends(get_db)):
     db_movie = Movie(
         title=movie.title,
         description=movie.description,
@@ -134,40 +1499,104 @@ def create_movie(movie: MovieCreate, db: Session = Depends(get_db)):
         image_url=movie.image_url
     )
     db.add(db_movie)
-    db.commit()
-    db.refresh(db_movie)
+    await db.flush()
+    await db.run_sync(index_movie, db_movie)
+    await db.commit()
+    await db.refresh(db_movie)
+    invalidate_movie_cache(db_movie.id, (db_movie.title, db_movie.genre))
     return db_movie
 
 @app.get("/movies/")
-def get_movies(db: Session = Depends(get_db)):
-    return db.query(Movie).all()
+async def get_movies(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    if stream:
+        return stream_ndjson(Movie, cursor)
+    return timed_json(await paginate(db, Movie, limit, cursor, request, response), response)
 
-@app.get("/movies/{movie_id}")
-def get_movie(movie_id: int, db: Session = Depends(get_db)):
-    movie = db.query(Movie).filter(Movie.id == movie_id).first()
-    if not movie:
+@app.get("/movies/top")
+async def get_top_movies(
+    genre: Optional[str] = None,
+    min_reviews: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    query = (
+        select(Movie, MovieStats)
+        .join(MovieStats, MovieStats.movie_id == Movie.id)
+        .where(MovieStats.review_count >= min_reviews)
+    )
+    if genre:
+        query = query.where(Movie.genre == genre)
+    query = query.order_by(MovieStats.rating_avg.desc(), MovieStats.review_count.desc()).limit(limit)
+    rows = (await db.execute(query)).all()
+    return timed_json([{**row_to_dict(movie), "stats": stats_to_dict(movie.id, stats)} for movie, stats in rows])
+
+@app.api_route("/movies/{movie_id}/poster", methods=["GET", "HEAD"])
+async def get_movie_poster(
+    movie_id: int,
+    request: Request,
+    width: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    movie = await db.get(Movie, movie_id)
+    if not movie or not movie.image_url:
         raise HTTPException(status_code=404, detail="Movie not found")
-    return movie
+    if movie.image_url.startswith(("http://", "https://")):
+        return RedirectResponse(movie.image_url)
+    return await image_response(request, os.path.basename(movie.image_url), width)
 
-@app.get("/movies/title/{title}")
-def get_movie_by_title(title: str, db: Session = Depends(get_db)):
-    movies = db.query(Movie).filter(Movie.title == title).all()
-    if not movies:
+@app.get("/movies/{movie_id}/stats")
+async def get_movie_stats(movie_id: int, db: AsyncSession = Depends(get_db)):
+    stats = await db.get(MovieStats, movie_id)
+    if stats is None and not await db.get(Movie, movie_id):
         raise HTTPException(status_code=404, detail="Movie not found")
-    return movies
+    return stats_to_dict(movie_id, stats)
+
+@app.get("/movies/{movie_id}")
+async def get_movie(movie_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    generation = read_cache.generation(("movie", movie_id))
+    entry = read_cache.get(("movie", movie_id))
+    if entry is None:
+        movie = await db.scalar(select(Movie).where(Movie.id == movie_id))
+        if not movie:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        entry = read_cache.set(("movie", movie_id), row_to_dict(movie), generation)
+    return cached_response(request, entry)
+
+@app.get("/movies/title/{title}")
+async def get_movie_by_title(title: str, request: Request, db: AsyncSession = Depends(get_db)):
+    generation = read_cache.generation(("title", title))
+    entry = read_cache.get(("title", title))
+    if entry is None:
+        movies = (await db.scalars(select(Movie).where(Movie.title == title))).all()
+        if not movies:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        entry = read_cache.set(("title", title), [row_to_dict(movie) for movie in movies], generation)
+    return cached_response(request, entry)
 
 @app.get("/movies/genre/{genre}")
-def get_movie_by_genre(genre: str, db: Session = Depends(get_db)):
-    movies = db.query(Movie).filter(Movie.genre == genre).all()
-    if not movies:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    return movies
+async def get_movie_by_genre(genre: str, request: Request, db: AsyncSession = Depends(get_db)):
+    generation = read_cache.generation(("genre", genre))
+    entry = read_cache.get(("genre", genre))
+    if entry is None:
+        movies = (await db.scalars(select(Movie).where(Movie.genre == genre))).all()
+        if not movies:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        entry = read_cache.set(("genre", genre), [row_to_dict(movie) for movie in movies], generation)
+    return cached_response(request, entry)
 
 @app.put("/movies/{movie_id}")
-def update_movie(movie_id: int, movie: MovieCreate, db: Session = Depends(get_db)):
-    db_movie = db.query(Movie).filter(Movie.id == movie_id).first()
+async def update_movie(movie_id: int, movie: MovieCreate, db: AsyncSession = Depends(get_db)):
+    db_movie = await db.scalar(select(Movie).where(Movie.id == movie_id))
     if not db_movie:
         raise HTTPException(status_code=404, detail="Movie not found")
+    previous = (db_movie.title, db_movie.genre)
 
     db_movie.title = movie.title
     db_movie.description = movie.description
@@ -175,66 +1604,208 @@ def update_movie(movie_id: int, movie: MovieCreate, db: Session = Depends(get_db
     db_movie.genre = movie.genre
     db_movie.rating = movie.rating
     db_movie.image_url = movie.image_url
+    await db.run_sync(reindex_movie, db_movie)
 
-    db.commit()
-    db.refresh(db_movie)
+    await db.commit()
+    await db.refresh(db_movie)
+    invalidate_movie_cache(movie_id, previous, (db_movie.title, db_movie.genre))
     return db_movie
 
 @app.delete("/movies/{movie_id}")
-def delete_movie(movie_id: int, db: Session = Depends(get_db)):
-    db_movie = db.query(Movie).filter(Movie.id == movie_id).first()
+async def delete_movie(movie_id: int, db: AsyncSession = Depends(get_db)):
+    db_movie = await db.scalar(select(Movie).where(Movie.id == movie_id))
     if not db_movie:
         raise HTTPException(status_code=404, detail="Movie not found")
-    db.delete(db_movie)
-    db.commit()
+    await db.execute(delete(MovieStats).where(MovieStats.movie_id == movie_id))
+    await db.run_sync(unindex, "movie", movie_id)
+    previous = (db_movie.title, db_movie.genre)
+    await db.delete(db_movie)
+    await db.commit()
+    invalidate_movie_cache(movie_id, previous)
     return {"detail": "Movie deleted"}
 
 @app.post("/movies/{title}/reviews/")
-def create_review(title: str, review: ReviewCreate, db: Session = Depends(get_db)):
-    db_movie = db.query(Movie).filter(Movie.title == title).first()
+async def create_review(title: str, review: ReviewCreate, db: AsyncSession = Depends(get_db)):
+    db_movie = await db.scalar(select(Movie).where(Movie.title == title))
     if not db_movie:
         raise HTTPException(status_code=404, detail="Movie not found")
     db_review = Review(content=review.content, rating=review.rating, movie_id=db_movie.id)
     db.add(db_review)
-    db.commit()
-    db.refresh(db_review)
+    await db.flush()
+    await db.run_sync(apply_review_to_stats, db_movie.id, review.rating)
+    await db.run_sync(index_review, db_review)
+    await db.commit()
+    await db.refresh(db_review)
+    read_cache.invalidate(("reviews", title))
     return db_review
 
 @app.get("/reviews/{review_id}")
-def get_review_by_id(review_id: int, db: Session = Depends(get_db)):
-    review = db.query(Review).filter(Review.id == review_id).first()
+async def get_review_by_id(review_id: int, db: AsyncSession = Depends(get_db)):
+    review = await db.scalar(select(Review).where(Review.id == review_id))
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     return review
 
 @app.get("/movies/{title}/reviews/")
-def get_reviews_by_title(title: str, db: Session = Depends(get_db)):
-    db_movie = db.query(Movie).filter(Movie.title == title).first()
-    if not db_movie:
-        raise HTTPException(status_code=404, detail="Movie not found")
-    reviews = db.query(Review).filter(Review.movie_id == db_movie.id).all()
-    return reviews
+async def get_reviews_by_title(title: str, request: Request, db: AsyncSession = Depends(get_db)):
+    generation = read_cache.generation(("reviews", title))
+    entry = read_cache.get(("reviews", title))
+    if entry is None:
+        db_movie = await db.scalar(select(Movie).where(Movie.title == title))
+        if not db_movie:
+            raise HTTPException(status_code=404, detail="Movie not found")
+        reviews = (await db.scalars(select(Review).where(Review.movie_id == db_movie.id))).all()
+        entry = read_cache.set(("reviews", title), [row_to_dict(review) for review in reviews], generation)
+    return cached_response(request, entry)
 
 @app.get("/reviews/")
-def get_all_reviews(db: Session = Depends(get_db)):
-    return db.query(Review).all()
+async def get_all_reviews(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    if stream:
+        return stream_ndjson(Review, cursor)
+    return timed_json(await paginate(db, Review, limit, cursor, request, response), response)
+
+async def lock_review(db: AsyncSession, review_id: int) -> Optional[Review]:
+    # Una escritura vacía toma el bloqueo (fila en Postgres, base en SQLite) antes de leer
+    # la calificación anterior, así dos cambios a la misma reseña no restan el mismo valor
+    await db.execute(
+        update(Review)
+        .where(Review.id == review_id)
+        .values(rating=Review.rating)
+        .execution_options(synchronize_session=False)
+    )
+    return await db.scalar(
+        select(Review).where(Review.id == review_id).execution_options(populate_existing=True)
+    )
 
 @app.put("/reviews/{review_id}")
-def update_review(review_id: int, review: ReviewCreate, db: Session = Depends(get_db)):
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+async def update_review(review_id: int, review: ReviewCreate, db: AsyncSession = Depends(get_db)):
+    db_review = await lock_review(db, review_id)
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
+    if db_review.movie_id is not None:
+        await db.run_sync(apply_rating_change, db_review.movie_id, db_review.rating, review.rating)
     db_review.content = review.content
     db_review.rating = review.rating
-    db.commit()
-    db.refresh(db_review)  
+    await db.run_sync(reindex_review, db_review)
+    await db.commit()
+    await db.refresh(db_review)
+    await invalidate_reviews_cache(db, db_review.movie_id)
     return db_review
 
 @app.delete("/reviews/{review_id}")
-def delete_review(review_id: int, db: Session = Depends(get_db)):
-    db_review = db.query(Review).filter(Review.id == review_id).first()
+async def delete_review(review_id: int, db: AsyncSession = Depends(get_db)):
+    db_review = await lock_review(db, review_id)
     if not db_review:
         raise HTTPException(status_code=404, detail="Review not found")
-    db.delete(db_review)
-    db.commit()
-    return {"detail": "Review deleted"}
\ No newline at end of file
+    if db_review.movie_id is not None:
+        await db.run_sync(apply_review_to_stats, db_review.movie_id, db_review.rating, -1)
+    await db.run_sync(unindex, "review", review_id)
+    await db.delete(db_review)
+    await db.commit()
+    await invalidate_reviews_cache(db, db_review.movie_id)
+    return {"detail": "Review deleted"}
+
+@app.get("/search")
+async def search(
+    q: str = Query(..., min_length=1),
+    kind: Optional[str] = Query(None, alias="type", pattern="^(movie|review)$"),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+):
+    hits = await db.run_sync(search_index.search, q, limit, kind)
+    movie_ids = [ref_id for hit_kind, ref_id, _ in hits if hit_kind == "movie"]
+    review_ids = [ref_id for hit_kind, ref_id, _ in hits if hit_kind == "review"]
+    rows = {}
+    if movie_ids:
+        for movie in await db.scalars(select(Movie).where(Movie.id.in_(movie_ids))):
+            rows[("movie", movie.id)] = movie
+    if review_ids:
+        for review in await db.scalars(select(Review).where(Review.id.in_(review_ids))):
+            rows[("review", review.id)] = review
+    return timed_json([
+        {"type": hit_kind, "score": round(score, 4), **row_to_dict(rows[(hit_kind, ref_id)])}
+        for hit_kind, ref_id, score in hits
+        if (hit_kind, ref_id) in rows
+    ])
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return read_cache.stats()
+
+async def read_lines(request: Request):
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+@app.post("/import/{kind}")
+async def bulk_import(
+    request: Request,
+    kind: str = Path(..., pattern="^(movies|reviews)$"),
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    db: AsyncSession = Depends(get_db),
+):
+    importer = IMPORTERS[kind]
+    reader = BulkReader(bulk_format(format, request.headers.get("content-type")))
+    result = BulkResult()
+
+    async def import_batch(batch):
+        inserted, errors, cache_keys = await db.run_sync(importer, batch)
+        await db.commit()
+        read_cache.invalidate(*cache_keys)
+        result.add(inserted, errors)
+
+    async for line in read_lines(request):
+        batch = reader.feed(line)
+        if batch:
+            await import_batch(batch)
+    batch = reader.finish()
+    if batch:
+        await import_batch(batch)
+    return result.to_dict()
+
+@app.get("/export/{kind}")
+async def bulk_export(
+    kind: str = Path(..., pattern="^(movies|reviews)$"),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+):
+    columns = export_columns(kind)
+
+    async def generate():
+        yield format_export_header(format, columns)
+        async with AsyncSessionLocal() as db:
+            rows = await db.stream(export_query(kind).execution_options(yield_per=STREAM_BATCH_SIZE))
+            async for row in rows.mappings():
+                yield format_export_row(row, format, columns)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="{kind}.{format}"'}
+    return StreamingResponse(generate(), media_type=media_type, headers=headers)
+
+@app.api_route("/images/{filename}", methods=["GET", "HEAD"])
+async def get_image(filename: str, request: Request, width: Optional[int] = None):
+    return await image_response(request, filename, width)
+
+@app.get("/metrics")
+async def get_metrics():
+    cache = read_cache.stats()
+    gauges = {
+        "reviewapi_cache_entries": cache["size"],
+        "reviewapi_cache_hits_total": cache["hits"],
+        "reviewapi_cache_misses_total": cache["misses"],
+        "reviewapi_cache_evictions_total": cache["evictions"],
+    }
+    return Response(content=metrics.render(gauges), media_type="text/plain; version=0.0.4")
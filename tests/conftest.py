@@ -0,0 +1,49 @@
+import itertools
+import os
+import sys
+import tempfile
+
+# main lee la configuración al importarse: la base de pruebas se fija antes
+_tmp = tempfile.mkdtemp(prefix="reviewapi-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["THUMBNAIL_CACHE_DIR"] = os.path.join(_tmp, "thumbnails")
+os.environ["TOKEN_SECRET"] = "test-secret"
+os.environ["PASSWORD_SCRYPT_N"] = "1024"
+os.environ["OPTIMIZE_INTERVAL_SECONDS"] = "0"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import pytest
+
+import main
+
+_titles = itertools.count(1)
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+@pytest.fixture
+async def client():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        yield client
+
+@pytest.fixture
+def new_movie(client):
+    # Cada prueba usa títulos propios porque la base se comparte durante la sesión
+    async def create(**fields):
+        movie = {
+            "title": f"Película de prueba {next(_titles)}",
+            "description": "una película",
+            "year": 2000,
+            "genre": "Drama",
+            "rating": 7,
+            "image_url": "images/Cars.jpg",
+        }
+        movie.update(fields)
+        response = await client.post("/movies/", json=movie)
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return create
@@ -0,0 +1,127 @@
+import csv
+import io
+
+import pytest
+from sqlalchemy import select
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+async def export_csv(client, kind: str):
+    response = await client.get(f"/export/{kind}", params={"format": "csv"})
+    assert response.status_code == 200
+    return list(csv.DictReader(io.StringIO(response.text, newline="")))
+
+def to_csv(rows) -> str:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(rows[0]), lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+async def import_csv(client, kind: str, rows):
+    response = await client.post(
+        f"/import/{kind}", content=to_csv(rows).encode(), headers={"content-type": "text/csv"}
+    )
+    assert response.status_code == 200
+    return response.json()
+
+async def test_csv_export_import_round_trip(client, new_movie):
+    movie = await new_movie(description='Primera línea\nsegunda, con coma y "comillas"\r\ntercera')
+    for content, rating in (("buena,\nmuy buena", 9), ('"regular"', 5.5)):
+        response = await client.post(f"/movies/{movie['title']}/reviews/", json={"content": content, "rating": rating})
+        assert response.status_code == 200
+
+    movies = [row for row in await export_csv(client, "movies") if row["title"] == movie["title"]]
+    reviews = [row for row in await export_csv(client, "reviews") if row["title"] == movie["title"]]
+    assert movies[0]["description"] == movie["description"]
+    assert len(reviews) == 2
+
+    # Se borra y se restaura desde el respaldo: las reseñas se vuelven a asociar por título
+    assert (await client.delete(f"/movies/{movie['id']}")).status_code == 200
+    assert (await import_csv(client, "movies", movies))["inserted"] == 1
+    assert (await import_csv(client, "reviews", reviews))["inserted"] == 2
+
+    restored = (await client.get(f"/movies/title/{movie['title']}")).json()[0]
+    assert {key: value for key, value in restored.items() if key != "id"} == {
+        key: value for key, value in movie.items() if key != "id"
+    }
+    with main.SessionLocal() as db:
+        restored_reviews = db.execute(
+            select(main.Review.content, main.Review.rating).where(main.Review.movie_id == restored["id"])
+        ).all()
+    assert sorted(restored_reviews) == [('"regular"', 5.5), ("buena,\nmuy buena", 9.0)]
+    stats = (await client.get(f"/movies/{restored['id']}/stats")).json()
+    assert stats["review_count"] == 2 and stats["average"] == 7.25
+
+async def test_review_import_prefers_title_over_movie_id(client, new_movie):
+    first, second = await new_movie(), await new_movie()
+    rows = [{"title": second["title"], "movie_id": first["id"], "content": "por título", "rating": 6}]
+    assert (await import_csv(client, "reviews", rows))["inserted"] == 1
+    assert (await client.get(f"/movies/{second['id']}/stats")).json()["review_count"] == 1
+    assert (await client.get(f"/movies/{first['id']}/stats")).json()["review_count"] == 0
+
+def test_insert_batch_reports_only_rejected_rows():
+    movie = {"description": "d", "year": 2000, "genre": "Drama", "rating": 5, "image_url": "x"}
+    rows = [(line, {**movie, "title": title}) for line, title in ((1, "Lote A"), (2, "Lote B"), (3, "Lote A"))]
+    with main.SessionLocal() as db:
+        inserted, errors = main.insert_batch(db, main.Movie, rows)
+        db.commit()
+        assert [row["title"] for row in inserted] == ["Lote A", "Lote B"]
+        assert [error["line"] for error in errors] == [3]
+        assert db.scalar(select(main.func.count()).where(main.Movie.title.in_(["Lote A", "Lote B"]))) == 2
+
+def test_csv_reader_reports_unterminated_quoted_field():
+    reader = main.BulkReader("csv")
+    for line in ("title,content,rating\n", 'A,"sin cerrar\n', "sigue\n"):
+        assert reader.feed(line) is None
+    assert reader.finish() == [(2, None, "invalid csv: unterminated quoted field")]
+
+def test_csv_reader_treats_mid_field_quotes_as_data():
+    reader = main.BulkReader("csv")
+    lines = ["title,content,rating\n", 'A,10" screen,5\n', "A,ok,6\n"]
+    batch = [row for line in lines for row in reader.feed(line) or []] + reader.finish()
+    assert batch == [
+        (2, {"title": "A", "content": '10" screen', "rating": "5"}, None),
+        (3, {"title": "A", "content": "ok", "rating": "6"}, None),
+    ]
+
+def test_csv_reader_caps_lines_buffered_for_one_record(monkeypatch):
+    monkeypatch.setattr(main, "BULK_CSV_MAX_RECORD_LINES", 3)
+    reader = main.BulkReader("csv")
+    lines = ["title,content,rating\n", 'A,"sin cerrar\n', "1\n", "2\n", "B,ok,6\n"]
+    batch = [row for line in lines for row in reader.feed(line) or []] + reader.finish()
+    assert batch == [
+        (2, None, "invalid csv: quoted field spans more than 3 lines"),
+        (5, {"title": "B", "content": "ok", "rating": "6"}, None),
+    ]
+
+async def test_empty_strings_and_null_image_survive_round_trip(client, new_movie):
+    movie = await new_movie(description="")
+    response = await client.post(f"/movies/{movie['title']}/reviews/", json={"content": "", "rating": 4})
+    assert response.status_code == 200
+    with main.SessionLocal() as db:
+        db.get(main.Movie, movie["id"]).image_url = None
+        db.commit()
+
+    movies = [row for row in await export_csv(client, "movies") if row["title"] == movie["title"]]
+    reviews = [row for row in await export_csv(client, "reviews") if row["title"] == movie["title"]]
+    response = await client.get("/export/movies", params={"format": "ndjson"})
+    exported = [line for line in response.text.splitlines() if f'"title": "{movie["title"]}"' in line]
+    assert '"image_url": null' in exported[0]
+
+    assert (await client.delete(f"/movies/{movie['id']}")).status_code == 200
+    response = await client.post("/import/movies", content=exported[0].encode())
+    assert response.json()["inserted"] == 1
+    assert (await import_csv(client, "reviews", reviews))["inserted"] == 1
+
+    restored = (await client.get(f"/movies/title/{movie['title']}")).json()[0]
+    assert restored["description"] == "" and restored["image_url"] is None
+    with main.SessionLocal() as db:
+        contents = db.scalars(select(main.Review.content).where(main.Review.movie_id == restored["id"])).all()
+    assert contents == [""]
+
+    # En CSV la película también entra: la descripción vacía no se confunde con un campo ausente
+    assert (await client.delete(f"/movies/{restored['id']}")).status_code == 200
+    assert (await import_csv(client, "movies", movies))["inserted"] == 1
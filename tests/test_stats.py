@@ -0,0 +1,75 @@
+import asyncio
+import random
+
+import pytest
+from sqlalchemy import delete, select
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+def recomputed_stats(movie_id: int):
+    with main.SessionLocal() as db:
+        ratings = db.scalars(select(main.Review.rating).where(main.Review.movie_id == movie_id)).all()
+    histogram = {}
+    for rating in ratings:
+        bucket = str(main.rating_bucket(rating))
+        histogram[bucket] = histogram.get(bucket, 0) + 1
+    return {
+        "movie_id": movie_id,
+        "review_count": len(ratings),
+        "average": round(sum(ratings) / len(ratings), 2) if ratings else None,
+        "histogram": histogram,
+    }
+
+async def assert_stats_match_reviews(client, movie_id: int):
+    response = await client.get(f"/movies/{movie_id}/stats")
+    assert response.status_code == 200
+    assert response.json() == recomputed_stats(movie_id)
+
+async def add_review(client, movie, rating: float):
+    response = await client.post(f"/movies/{movie['title']}/reviews/", json={"content": "reseña", "rating": rating})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+async def test_stats_follow_create_update_delete(client, new_movie):
+    movie = await new_movie()
+    await assert_stats_match_reviews(client, movie["id"])
+
+    reviews = [await add_review(client, movie, rating) for rating in (3, 7.5, 10)]
+    await assert_stats_match_reviews(client, movie["id"])
+
+    response = await client.put(f"/reviews/{reviews[0]['id']}", json={"content": "cambio", "rating": 9})
+    assert response.status_code == 200
+    await assert_stats_match_reviews(client, movie["id"])
+
+    response = await client.delete(f"/reviews/{reviews[1]['id']}")
+    assert response.status_code == 200
+    await assert_stats_match_reviews(client, movie["id"])
+
+async def test_concurrent_writes_keep_stats_consistent(client, new_movie):
+    movie = await new_movie()
+    reviews = [await add_review(client, movie, 5) for _ in range(12)]
+    rng = random.Random(7)
+
+    async def write(review):
+        if review["id"] % 3 == 0:
+            return await client.delete(f"/reviews/{review['id']}")
+        return await client.put(f"/reviews/{review['id']}", json={"content": "cambio", "rating": rng.randint(1, 10)})
+
+    responses = await asyncio.gather(*(write(review) for review in reviews), *(write(review) for review in reviews))
+    assert all(response.status_code in (200, 404) for response in responses)
+    await assert_stats_match_reviews(client, movie["id"])
+
+async def test_rebuild_matches_incremental_stats(client, new_movie):
+    movie = await new_movie()
+    for rating in (1, 4, 4, 8.5):
+        await add_review(client, movie, rating)
+    before = (await client.get(f"/movies/{movie['id']}/stats")).json()
+
+    with main.SessionLocal() as db:
+        db.execute(delete(main.MovieStats).where(main.MovieStats.movie_id == movie["id"]))
+        main.rebuild_movie_stats(db)
+        db.commit()
+
+    assert (await client.get(f"/movies/{movie['id']}/stats")).json() == before == recomputed_stats(movie["id"])